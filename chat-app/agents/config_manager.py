@@ -1,101 +1,140 @@
-from typing import Dict, Any, Optional
-from supabase import create_client, Client
-import os
-import json
+from typing import Dict, Any, Mapping, Optional
+from postgrest import AsyncPostgrestClient
+import asyncio
+import copy
+import time
+from types import MappingProxyType
 from datetime import datetime
+from .supabase_client import get_supabase
+from . import json_utils
+
+# Default agent configuration, used when none is stored in Supabase
+_DEFAULT_CONFIG: Dict[str, Any] = {
+    "personality": "Professional, friendly, and knowledgeable real estate assistant who helps clients find their perfect home",
+    "system_prompt": """You are a helpful real estate assistant. Your role is to:
+1. Help users find properties that match their needs
+2. Qualify leads by understanding their budget, timeline, and preferences  
+3. Schedule property viewings and appointments
+4. Provide market information and neighborhood insights
+5. Guide users through the home buying/selling process
+6. Escalate complex issues to human agents when needed
+
+Always be professional, empathetic, and solution-focused.""",
+    "response_style": "conversational",
+    "max_response_length": 250,
+    "tools_enabled": [
+        "property_search",
+        "lead_qualification", 
+        "schedule_viewing",
+        "market_info",
+        "escalate_human"
+    ],
+    "services": [
+        "Property Search",
+        "Market Analysis", 
+        "Viewing Appointments",
+        "Buyer/Seller Guidance",
+        "Neighborhood Information"
+    ],
+    "greeting_message": "Hi! I'm your AI real estate assistant. I'm here to help you find your perfect home or answer any real estate questions you might have. How can I assist you today?",
+    "escalation_triggers": [
+        "complaint",
+        "legal_question",
+        "complex_negotiation",
+        "technical_issue"
+    ],
+    "lead_qualification_fields": [
+        "budget_range",
+        "preferred_location",
+        "property_type",
+        "timeline",
+        "contact_info"
+    ]
+}
+
+_DEFAULT_CONFIG_JSON = json_utils.dumps(_DEFAULT_CONFIG)
+
+# Predefined personality presets for the admin panel
+_PERSONALITY_PRESETS: Mapping[str, Mapping[str, Any]] = MappingProxyType({
+    "professional": MappingProxyType({
+        "personality": "Professional, formal, and detail-oriented real estate expert",
+        "response_style": "formal",
+        "greeting_message": "Good day! I am your professional real estate consultant. How may I assist you with your property needs today?"
+    }),
+    "friendly": MappingProxyType({
+        "personality": "Warm, friendly, and approachable real estate helper who makes home buying fun",
+        "response_style": "conversational", 
+        "greeting_message": "Hey there! I'm excited to help you find your dream home! What kind of place are you looking for?"
+    }),
+    "expert": MappingProxyType({
+        "personality": "Highly knowledgeable real estate expert with deep market insights and analytical approach",
+        "response_style": "informative",
+        "greeting_message": "Hello! I'm your real estate market expert. I can provide detailed analysis and insights to help you make informed decisions. What would you like to know?"
+    }),
+    "luxury": MappingProxyType({
+        "personality": "Sophisticated luxury real estate specialist focused on high-end properties and white-glove service",
+        "response_style": "elegant",
+        "greeting_message": "Welcome! I specialize in luxury real estate and premium properties. I'm here to provide you with exceptional service. How may I assist you today?"
+    })
+})
 
 class AgentConfigManager:
     def __init__(self):
-        self.supabase: Client = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_ANON_KEY")
-        )
+        self.supabase: AsyncPostgrestClient = get_supabase()
         self._cache = {}
-        self._cache_timestamp = None
+        self._cache_expires_at: float = 0.0
         self._cache_ttl = 300  # 5 minutes
+        self._error_ttl = 5  # seconds to serve the fallback after a failed fetch
+        self._refresh_lock = asyncio.Lock()
     
     async def get_agent_config(self) -> Dict[str, Any]:
         """Get agent configuration from Supabase with caching"""
-        now = datetime.now()
-        
         # Check cache first
-        if (self._cache_timestamp and 
-            (now - self._cache_timestamp).seconds < self._cache_ttl and 
-            self._cache):
-            return self._cache
+        if time.monotonic() < self._cache_expires_at:
+            return self._cache or _DEFAULT_CONFIG
         
-        try:
-            # Fetch from Supabase settings table
-            response = self.supabase.table('settings').select('*').eq('key', 'agent_config').execute()
-            
-            if response.data:
-                config = json.loads(response.data[0]['value'])
-            else:
-                # Default configuration if none exists
-                config = self._get_default_config()
-                await self._save_default_config(config)
-            
-            # Update cache
-            self._cache = config
-            self._cache_timestamp = now
+        async with self._refresh_lock:
+            # Another coroutine may have refreshed the cache (or hit an error)
+            # while we waited
+            if time.monotonic() < self._cache_expires_at:
+                return self._cache or _DEFAULT_CONFIG
             
-            return config
-            
-        except Exception as e:
-            print(f"Error fetching agent config: {e}")
-            return self._get_default_config()
+            try:
+                # Fetch from Supabase settings table
+                response = await self.supabase.table('settings').select('value').eq('key', 'agent_config').limit(1).maybe_single().execute()
+                
+                # maybe_single() yields no response at all on some client versions
+                if response and response.data:
+                    config = json_utils.loads(response.data['value'])
+                else:
+                    # Default configuration if none exists
+                    config = self._get_default_config()
+                    await self._save_default_config()
+                
+                # Update cache
+                self._cache = config
+                self._cache_expires_at = time.monotonic() + self._cache_ttl
+                
+                return config
+                
+            except Exception as e:
+                print(f"Error fetching agent config: {e}")
+                # Keep serving the last known config rather than the defaults,
+                # and hold off retrying briefly so waiters don't each repeat
+                # the failing fetch
+                self._cache_expires_at = time.monotonic() + self._error_ttl
+                return self._cache or _DEFAULT_CONFIG
     
     def _get_default_config(self) -> Dict[str, Any]:
-        """Default agent configuration"""
-        return {
-            "personality": "Professional, friendly, and knowledgeable real estate assistant who helps clients find their perfect home",
-            "system_prompt": """You are a helpful real estate assistant. Your role is to:
-1. Help users find properties that match their needs
-2. Qualify leads by understanding their budget, timeline, and preferences  
-3. Schedule property viewings and appointments
-4. Provide market information and neighborhood insights
-5. Guide users through the home buying/selling process
-6. Escalate complex issues to human agents when needed
-
-Always be professional, empathetic, and solution-focused.""",
-            "response_style": "conversational",
-            "max_response_length": 250,
-            "tools_enabled": [
-                "property_search",
-                "lead_qualification", 
-                "schedule_viewing",
-                "market_info",
-                "escalate_human"
-            ],
-            "services": [
-                "Property Search",
-                "Market Analysis", 
-                "Viewing Appointments",
-                "Buyer/Seller Guidance",
-                "Neighborhood Information"
-            ],
-            "greeting_message": "Hi! I'm your AI real estate assistant. I'm here to help you find your perfect home or answer any real estate questions you might have. How can I assist you today?",
-            "escalation_triggers": [
-                "complaint",
-                "legal_question",
-                "complex_negotiation",
-                "technical_issue"
-            ],
-            "lead_qualification_fields": [
-                "budget_range",
-                "preferred_location",
-                "property_type",
-                "timeline",
-                "contact_info"
-            ]
-        }
+        """Default agent configuration (a private copy the caller may mutate)"""
+        return copy.deepcopy(_DEFAULT_CONFIG)
     
-    async def _save_default_config(self, config: Dict[str, Any]) -> None:
+    async def _save_default_config(self) -> None:
         """Save default configuration to Supabase"""
         try:
-            self.supabase.table('settings').upsert({
+            await self.supabase.table('settings').upsert({
                 'key': 'agent_config',
-                'value': json.dumps(config),
+                'value': _DEFAULT_CONFIG_JSON,
                 'updated_at': datetime.now().isoformat()
             }).execute()
         except Exception as e:
@@ -104,22 +143,22 @@ Always be professional, empathetic, and solution-focused.""",
     async def update_agent_config(self, updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update agent configuration (called from admin panel)"""
         try:
-            # Get current config
-            current_config = await self.get_agent_config()
-            
-            # Merge updates
-            updated_config = {**current_config, **updates}
-            
-            # Save to Supabase
-            self.supabase.table('settings').upsert({
-                'key': 'agent_config',
-                'value': json.dumps(updated_config),
-                'updated_at': datetime.now().isoformat()
+            # Merge updates into the stored config server-side in one round trip
+            # (see supabase/migrations/002_update_setting_merge.sql)
+            response = await self.supabase.rpc('update_setting_merge', {
+                'setting_key': 'agent_config',
+                'patch': updates,
+                'base': _DEFAULT_CONFIG
             }).execute()
+            updated_config = response.data
             
-            # Clear cache
-            self._cache = {}
-            self._cache_timestamp = None
+            # The RPC returns the merged config, so cache it directly instead
+            # of fetching it again on the next read
+            if isinstance(updated_config, dict):
+                self._cache = updated_config
+                self._cache_expires_at = time.monotonic() + self._cache_ttl
+            else:
+                self.invalidate_cache()
             
             return updated_config
             
@@ -127,48 +166,28 @@ Always be professional, empathetic, and solution-focused.""",
             print(f"Error updating agent config: {e}")
             raise
     
-    async def get_personality_presets(self) -> Dict[str, Dict[str, Any]]:
+    @staticmethod
+    def get_personality_presets() -> Mapping[str, Mapping[str, Any]]:
         """Get predefined personality presets for admin panel"""
-        return {
-            "professional": {
-                "personality": "Professional, formal, and detail-oriented real estate expert",
-                "response_style": "formal",
-                "greeting_message": "Good day! I am your professional real estate consultant. How may I assist you with your property needs today?"
-            },
-            "friendly": {
-                "personality": "Warm, friendly, and approachable real estate helper who makes home buying fun",
-                "response_style": "conversational", 
-                "greeting_message": "Hey there! I'm excited to help you find your dream home! What kind of place are you looking for?"
-            },
-            "expert": {
-                "personality": "Highly knowledgeable real estate expert with deep market insights and analytical approach",
-                "response_style": "informative",
-                "greeting_message": "Hello! I'm your real estate market expert. I can provide detailed analysis and insights to help you make informed decisions. What would you like to know?"
-            },
-            "luxury": {
-                "personality": "Sophisticated luxury real estate specialist focused on high-end properties and white-glove service",
-                "response_style": "elegant",
-                "greeting_message": "Welcome! I specialize in luxury real estate and premium properties. I'm here to provide you with exceptional service. How may I assist you today?"
-            }
-        }
+        return _PERSONALITY_PRESETS
     
     async def apply_personality_preset(self, preset_name: str) -> Dict[str, Any]:
         """Apply a personality preset"""
-        presets = await self.get_personality_presets()
+        presets = self.get_personality_presets()
         
         if preset_name not in presets:
             raise ValueError(f"Unknown personality preset: {preset_name}")
         
-        preset_config = presets[preset_name]
+        preset_config = dict(presets[preset_name])
         return await self.update_agent_config(preset_config)
     
     async def get_analytics_config(self) -> Dict[str, Any]:
         """Get configuration for conversation analytics"""
         try:
-            response = self.supabase.table('settings').select('*').eq('key', 'analytics_config').execute()
+            response = await self.supabase.table('settings').select('value').eq('key', 'analytics_config').limit(1).maybe_single().execute()
             
-            if response.data:
-                return json.loads(response.data[0]['value'])
+            if response and response.data:
+                return json_utils.loads(response.data['value'])
             else:
                 return {
                     "track_conversations": True,
@@ -184,4 +203,4 @@ Always be professional, empathetic, and solution-focused.""",
     def invalidate_cache(self):
         """Manually invalidate configuration cache"""
         self._cache = {}
-        self._cache_timestamp = None 
\ No newline at end of file
+        self._cache_expires_at = 0.0 
\ No newline at end of file
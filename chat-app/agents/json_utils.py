@@ -0,0 +1,22 @@
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+    import json
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize obj to a JSON string (compact, or indented by 2 spaces),
+    using orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode()
+    if indent:
+        return json.dumps(obj, indent=2)
+    return json.dumps(obj, separators=(",", ":"))
+
+def loads(data: Any) -> Any:
+    """Deserialize a JSON str/bytes, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,13 +1,46 @@
 import os
+from typing import AsyncIterator, Optional
+import httpx
 from openai import AsyncOpenAI
 
+_client: Optional[AsyncOpenAI] = None
+
+def get_openai_client() -> AsyncOpenAI:
+    """Get the process-wide OpenAI client, creating it on first use so
+    that OPENAI_API_KEY is read after the environment has been loaded"""
+    global _client
+
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+                timeout=30.0
+            )
+        )
+
+    return _client
+
 class MyOpenAI:
     def __init__(self):
-        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.client = get_openai_client()
 
     async def ainvoke(self, messages, model="gpt-4-turbo"):
         response = await self.client.chat.completions.create(
             model=model,
             messages=messages,
         )
-        return response.choices[0].message 
\ No newline at end of file
+        return response.choices[0].message
+
+    async def astream(self, messages, model="gpt-4-turbo") -> AsyncIterator[str]:
+        """Stream the completion, yielding content deltas as they arrive"""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices:
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
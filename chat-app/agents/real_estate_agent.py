@@ -1,108 +1,133 @@
-from typing import Dict, List, Any, Optional
+from typing import AsyncIterator, Dict, List, Any, Optional
 from langgraph.graph import StateGraph, END
-from pydantic import BaseModel
-import json
-import os
+from dataclasses import dataclass, field
+import re
 from .config_manager import AgentConfigManager
 from .tools import RealEstateTools
 from .my_openai import MyOpenAI
+from . import json_utils
 
-class ConversationState(BaseModel):
-    messages: List[Dict[str, Any]] = []
+# Local intent routing table, checked in priority order
+_INTENT_ROUTES = (
+    ("escalate", re.compile(
+        r'\b(?:complain|complaint|lawyer|attorney|legal|sue|angry|frustrated|'
+        r'unacceptable|refund|manager|human|real person)', re.IGNORECASE)),
+    ("schedule_viewing", re.compile(
+        r'\b(?:viewing|appointment|schedule|tour|showing|book|visit|see the (?:house|home|property|place))',
+        re.IGNORECASE)),
+    ("lead_qualification", re.compile(
+        r'\b(?:budget|afford|pre-?approv|mortgage|financing|down payment|timeline|'
+        r'my name is|contact me|call me|email me)|'
+        r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}|\b\d{3}[-.]?\d{3}[-.]?\d{4}\b',
+        re.IGNORECASE)),
+    ("property_search", re.compile(
+        r'\b(?:\d+\s*(?:bed|br\b|bath)|bedroom|house|home|condo|apartment|townhouse|'
+        r'listing|propert|for sale|looking for|buy|rent)|\$\s*\d',
+        re.IGNORECASE)),
+    ("general_info", re.compile(
+        r'\b(?:market|price|trend|neighbou?rhood|area|school|process|closing|'
+        r'inspection|how (?:do|does|long|much))', re.IGNORECASE)),
+    ("greeting", re.compile(
+        r'^\W*(?:hi|hello|hey|howdy|greetings|good (?:morning|afternoon|evening))\b',
+        re.IGNORECASE)),
+)
+
+def _route_intent_local(text: str) -> Optional[str]:
+    """Classify intent with the local routing table, or None if no rule matches"""
+    for intent, pattern in _INTENT_ROUTES:
+        if pattern.search(text):
+            return intent
+    return None
+
+# Response system prompt. Everything derived from the agent config comes
+# first so the prompt prefix is byte-identical across turns and can be
+# served from OpenAI's prompt cache; per-turn details follow.
+_SYSTEM_TEMPLATE = """You are a {personality}.
+
+System Instructions: {system_prompt}
+
+Response style: {response_style}
+Max response length: {max_response_length} words
+
+Generate an appropriate response that:
+1. Addresses the user's needs based on the current step
+2. Uses the context information effectively
+3. Maintains the configured personality
+4. Encourages next steps in the real estate journey
+
+Current conversation step: {current_step}
+User input: {user_input}
+Conversation summary: {summary}
+Context: {context}
+Lead info: {lead_info}
+Tools used: {tools_used}
+"""
+
+# Every field is populated internally, so the state needs no runtime validation
+@dataclass(slots=True)
+class ConversationState:
+    messages: List[Dict[str, Any]] = field(default_factory=list)
     user_input: str = ""
     agent_response: str = ""
     current_step: str = "greeting"
-    user_context: Dict[str, Any] = {}
-    lead_info: Dict[str, Any] = {}
-    tools_used: List[str] = []
+    user_context: Dict[str, Any] = field(default_factory=dict)
+    lead_info: Dict[str, Any] = field(default_factory=dict)
+    tools_used: List[str] = field(default_factory=list)
+    # Compact facts carried across turns, written by the tool handlers, so the
+    # prompt stays the same size however long the conversation gets
+    summary: Dict[str, Any] = field(default_factory=dict)
+
+def _as_state(result: Any) -> ConversationState:
+    """Graph runs return the channel values as a dict; rebuild the state object"""
+    if isinstance(result, ConversationState):
+        return result
+    return ConversationState(**result)
 
 class RealEstateAgent:
-    def __init__(self):
-        self.config_manager = AgentConfigManager()
-        self.tools = RealEstateTools()
-        self.llm = MyOpenAI()
+    def __init__(self,
+                 config_manager: Optional[AgentConfigManager] = None,
+                 tools: Optional[RealEstateTools] = None,
+                 llm: Optional[MyOpenAI] = None):
+        self.config_manager = config_manager or AgentConfigManager()
+        self.tools = tools or RealEstateTools()
+        self.llm = llm or MyOpenAI()
+        # Each intent's local tool handler
+        self._tool_handlers = {
+            "greeting": self._handle_greeting,
+            "property_search": self._handle_property_search,
+            "lead_qualification": self._handle_lead_qualification,
+            "schedule_viewing": self._handle_schedule_viewing,
+            "general_info": self._provide_general_info,
+            "escalate": self._escalate_to_human
+        }
         self.graph = self._build_graph()
+        # Same workflow without the response step, used when the response is streamed
+        self.context_graph = self._build_graph(include_response=False)
     
-    def _build_graph(self) -> StateGraph:
-        """Build the LangGraph workflow for real estate conversations"""
-        workflow = StateGraph(ConversationState)
+    def _build_graph(self, include_response: bool = True) -> StateGraph:
+        """Build the LangGraph workflow for real estate conversations.
         
-        # Add nodes
-        workflow.add_node("analyze_intent", self._analyze_intent)
-        workflow.add_node("greeting", self._handle_greeting)
-        workflow.add_node("property_search", self._handle_property_search)
-        workflow.add_node("lead_qualification", self._handle_lead_qualification)
-        workflow.add_node("schedule_viewing", self._handle_schedule_viewing)
-        workflow.add_node("provide_info", self._provide_general_info)
-        workflow.add_node("escalate_human", self._escalate_to_human)
-        workflow.add_node("generate_response", self._generate_response)
-        
-        # Set entry point
-        workflow.set_entry_point("analyze_intent")
-        
-        # Add conditional edges based on intent analysis
-        workflow.add_conditional_edges(
-            "analyze_intent",
-            self._route_conversation,
-            {
-                "greeting": "greeting",
-                "property_search": "property_search", 
-                "lead_qualification": "lead_qualification",
-                "schedule_viewing": "schedule_viewing",
-                "general_info": "provide_info",
-                "escalate": "escalate_human"
-            }
-        )
-        
-        # All nodes flow to response generation
-        for node in ["greeting", "property_search", "lead_qualification", 
-                    "schedule_viewing", "provide_info", "escalate_human"]:
-            workflow.add_edge(node, "generate_response")
+        Intent routing and the tool handlers are local and cheap, so a turn
+        is a single node that makes exactly one LLM call for the response.
+        """
+        workflow = StateGraph(ConversationState)
         
-        workflow.add_edge("generate_response", END)
+        workflow.add_node("respond", self._respond if include_response else self._prepare_context)
+        workflow.set_entry_point("respond")
+        workflow.add_edge("respond", END)
         
         return workflow.compile()
     
-    async def _analyze_intent(self, state: ConversationState) -> ConversationState:
-        """Analyze user intent to route conversation"""
-        config = await self.config_manager.get_agent_config()
-        
-        intent_prompt = f"""
-        Analyze the user's message and determine their intent. 
-        Agent personality: {config.get('personality', 'Professional real estate assistant')}
-        
-        User message: {state.user_input}
-        Conversation history: {state.messages[-3:] if state.messages else []}
-        
-        Classify intent as one of:
-        - greeting: First contact, hello, introduction
-        - property_search: Looking for properties, homes, apartments
-        - lead_qualification: Budget, timeline, preferences questions
-        - schedule_viewing: Want to see properties, book appointments
-        - general_info: Market info, neighborhood questions, process questions
-        - escalate: Complex issues, complaints, need human agent
-        
-        Respond with just the intent classification.
-        """
-        
-        # OpenAI expects messages as list of dicts with 'role' and 'content'
-        messages = [
-            {"role": "system", "content": intent_prompt}
-        ]
-        response = await self.llm.ainvoke(messages)
-        intent = response.content.strip().lower()
-        
-        # Default to general_info if intent unclear
-        if intent not in ["greeting", "property_search", "lead_qualification", 
-                         "schedule_viewing", "general_info", "escalate"]:
-            intent = "general_info"
-            
-        state.current_step = intent
-        return state
+    async def _respond(self, state: ConversationState) -> ConversationState:
+        """Route the message, run its tool handler and generate the response"""
+        state = await self._prepare_context(state)
+        return await self._generate_response(state)
     
-    def _route_conversation(self, state: ConversationState) -> str:
-        """Route conversation based on analyzed intent"""
-        return state.current_step
+    async def _prepare_context(self, state: ConversationState) -> ConversationState:
+        """Route the message to an intent and run that intent's tool handler"""
+        # Messages the routing table can't place fall back to general info
+        state.current_step = _route_intent_local(state.user_input) or "general_info"
+        return await self._tool_handlers[state.current_step](state)
     
     async def _handle_greeting(self, state: ConversationState) -> ConversationState:
         """Handle greeting and introduction"""
@@ -120,28 +145,30 @@ class RealEstateAgent:
     async def _handle_property_search(self, state: ConversationState) -> ConversationState:
         """Handle property search requests"""
         # Extract search criteria from user input
-        search_criteria = await self.tools.extract_search_criteria(state.user_input)
+        search_criteria = self.tools.extract_search_criteria(state.user_input)
         
         # Perform property search (mock for now)
-        properties = await self.tools.search_properties(search_criteria)
+        properties = self.tools.search_properties(search_criteria)
         
         state.user_context.update({
             "search_criteria": search_criteria,
             "found_properties": properties,
             "needs_more_criteria": len(search_criteria) < 3
         })
+        if search_criteria:
+            state.summary["search_criteria"] = {**state.summary.get("search_criteria", {}), **search_criteria}
         
         state.tools_used.append("property_search")
         return state
     
     async def _handle_lead_qualification(self, state: ConversationState) -> ConversationState:
         """Handle lead qualification questions"""
-        qualification_data = await self.tools.extract_qualification_info(state.user_input)
+        qualification_data = self.tools.extract_qualification_info(state.user_input)
         
         state.lead_info.update(qualification_data)
         state.user_context.update({
             "qualification_complete": len(state.lead_info) >= 4,
-            "missing_info": await self.tools.get_missing_qualification_fields(state.lead_info)
+            "missing_info": self.tools.get_missing_qualification_fields(state.lead_info)
         })
         
         state.tools_used.append("lead_qualification")
@@ -149,102 +176,143 @@ class RealEstateAgent:
     
     async def _handle_schedule_viewing(self, state: ConversationState) -> ConversationState:
         """Handle viewing appointment scheduling"""
-        scheduling_info = await self.tools.extract_scheduling_info(state.user_input)
+        scheduling_info = self.tools.extract_scheduling_info(state.user_input)
         
         state.user_context.update({
             "scheduling_request": scheduling_info,
-            "available_slots": await self.tools.get_available_slots(),
+            "available_slots": self.tools.get_available_slots(),
             "needs_contact_info": not state.lead_info.get('phone') or not state.lead_info.get('email')
         })
+        if scheduling_info:
+            state.summary["scheduling_request"] = scheduling_info
         
         state.tools_used.append("schedule_viewing")
         return state
     
     async def _provide_general_info(self, state: ConversationState) -> ConversationState:
         """Provide general real estate information"""
-        info_type = await self.tools.classify_info_request(state.user_input)
-        relevant_info = await self.tools.get_market_info(info_type)
+        info_type = self.tools.classify_info_request(state.user_input)
+        relevant_info = self.tools.get_market_info(info_type)
         
         state.user_context.update({
             "info_type": info_type,
             "relevant_info": relevant_info
         })
+        state.summary["last_info_topic"] = info_type
         
         state.tools_used.append("general_info")
         return state
     
     async def _escalate_to_human(self, state: ConversationState) -> ConversationState:
         """Handle escalation to human agent"""
-        escalation_reason = await self.tools.analyze_escalation_need(state.user_input)
+        escalation_reason = self.tools.analyze_escalation_need(state.user_input)
         
         state.user_context.update({
             "escalation_reason": escalation_reason,
             "human_agent_needed": True,
-            "priority_level": await self.tools.determine_priority(escalation_reason)
+            "priority_level": self.tools.determine_priority(escalation_reason)
         })
+        state.summary["escalation_reason"] = escalation_reason
         
         state.tools_used.append("escalate_human")
         return state
     
     async def _generate_response(self, state: ConversationState) -> ConversationState:
         """Generate final response based on context and configuration"""
-        config = await self.config_manager.get_agent_config()
+        messages = await self._build_response_messages(state)
         
-        system_prompt = f"""
-        You are a {config.get('personality', 'professional and friendly real estate assistant')}.
-        
-        System Instructions: {config.get('system_prompt', 'Help users with real estate needs')}
-        
-        Current conversation step: {state.current_step}
-        User input: {state.user_input}
-        Context: {json.dumps(state.user_context, indent=2)}
-        Lead info: {json.dumps(state.lead_info, indent=2)}
-        Tools used: {state.tools_used}
+        response = await self.llm.ainvoke(messages)
+        state.agent_response = response.content
         
-        Response style: {config.get('response_style', 'conversational')}
-        Max response length: {config.get('max_response_length', 200)} words
+        self._record_turn(state)
+        return state
+    
+    async def _build_response_messages(self, state: ConversationState) -> List[Dict[str, str]]:
+        """Build the LLM messages for the final response"""
+        config = await self.config_manager.get_agent_config()
         
-        Generate an appropriate response that:
-        1. Addresses the user's needs based on the current step
-        2. Uses the context information effectively
-        3. Maintains the configured personality
-        4. Encourages next steps in the real estate journey
-        """
+        system_prompt = _SYSTEM_TEMPLATE.format_map({
+            "personality": config.get('personality', 'professional and friendly real estate assistant'),
+            "system_prompt": config.get('system_prompt', 'Help users with real estate needs'),
+            "response_style": config.get('response_style', 'conversational'),
+            "max_response_length": config.get('max_response_length', 200),
+            "current_step": state.current_step,
+            "user_input": state.user_input,
+            "summary": json_utils.dumps(state.summary, indent=True),
+            "context": json_utils.dumps(state.user_context, indent=True),
+            "lead_info": json_utils.dumps(state.lead_info, indent=True),
+            "tools_used": state.tools_used
+        })
         
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": state.user_input}
         ]
-        
-        response = await self.llm.ainvoke(messages)
-        state.agent_response = response.content
-        
-        # Add to conversation history
+    
+    def _record_turn(self, state: ConversationState) -> None:
+        """Add the completed exchange to conversation history"""
         state.messages.extend([
             {"role": "user", "content": state.user_input},
             {"role": "assistant", "content": state.agent_response}
         ])
-        
-        return state
     
-    async def chat(self, message: str, conversation_history: List[Dict] = None) -> Dict[str, Any]:
+    def _chat_result(self, state: ConversationState) -> Dict[str, Any]:
+        """Shape a finished conversation state into the chat API result"""
+        return {
+            "response": state.agent_response,
+            "conversation_history": state.messages,
+            "lead_info": state.lead_info,
+            "tools_used": state.tools_used,
+            "current_step": state.current_step,
+            "summary": state.summary
+        }
+    
+    async def chat(self, message: str, conversation_history: List[Dict] = None,
+                   summary: Dict[str, Any] = None) -> Dict[str, Any]:
         """Main chat interface"""
         initial_state = ConversationState(
             user_input=message,
-            messages=conversation_history or []
+            messages=conversation_history or [],
+            summary=summary or {}
         )
         
         # Run the graph
-        final_state = await self.graph.ainvoke(initial_state)
+        final_state = _as_state(await self.graph.ainvoke(initial_state))
         
-        # Save conversation and lead data if configured
+        # Save lead data in the background; the caller doesn't wait on the insert
         if final_state.lead_info:
-            await self.tools.save_lead_data(final_state.lead_info)
+            self.tools.queue_lead_data(final_state.lead_info)
         
-        return {
-            "response": final_state.agent_response,
-            "conversation_history": final_state.messages,
-            "lead_info": final_state.lead_info,
-            "tools_used": final_state.tools_used,
-            "current_step": final_state.current_step
-        } 
\ No newline at end of file
+        return self._chat_result(final_state)
+    
+    async def achat_stream(self, message: str, conversation_history: List[Dict] = None,
+                           summary: Dict[str, Any] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Streaming chat interface.
+        
+        Yields {"type": "delta", "content": ...} events as response tokens
+        arrive, then a single {"type": "done", ...} event carrying the same
+        fields as chat().
+        """
+        initial_state = ConversationState(
+            user_input=message,
+            messages=conversation_history or [],
+            summary=summary or {}
+        )
+        
+        # Run everything up to response generation, then stream the response
+        state = _as_state(await self.context_graph.ainvoke(initial_state))
+        messages = await self._build_response_messages(state)
+        
+        chunks = []
+        async for delta in self.llm.astream(messages):
+            chunks.append(delta)
+            yield {"type": "delta", "content": delta}
+        
+        state.agent_response = "".join(chunks)
+        self._record_turn(state)
+        
+        # Save lead data in the background; the caller doesn't wait on the insert
+        if state.lead_info:
+            self.tools.queue_lead_data(state.lead_info)
+        
+        yield {"type": "done", **self._chat_result(state)}
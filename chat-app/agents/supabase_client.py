@@ -0,0 +1,60 @@
+from typing import Optional
+import httpx
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+import os
+
+_client: Optional[AsyncPostgrestClient] = None
+
+# Connection attempts that fail (resets, DNS blips) are retried on a fresh
+# connection; requests that reached the server are never resent
+CONNECT_RETRIES = 2
+
+def create_postgrest_client(key: str, limits: Optional[httpx.Limits] = None) -> AsyncPostgrestClient:
+    """Create an async PostgREST client for the Supabase project, authenticated with key"""
+    supabase_url = os.getenv("SUPABASE_URL", "").rstrip("/")
+    client = AsyncPostgrestClient(
+        f"{supabase_url}/rest/v1",
+        headers={
+            **DEFAULT_POSTGREST_CLIENT_HEADERS,
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        }
+    )
+
+    # postgrest-py doesn't accept a custom HTTP client, so swap in a session
+    # with the requested pool limits and connect retries (the default one
+    # has not opened any connections yet). HTTP/2 lets concurrent queries,
+    # like the dashboard stats, share one connection.
+    default_session = client.session
+    client.session = httpx.AsyncClient(
+        base_url=default_session.base_url,
+        headers=default_session.headers,
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=limits or httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            retries=CONNECT_RETRIES
+        ),
+        timeout=httpx.Timeout(10.0) if limits is not None else default_session.timeout
+    )
+
+    return client
+
+def get_supabase() -> AsyncPostgrestClient:
+    """Get the process-wide async Supabase (PostgREST) client, creating it on first use"""
+    global _client
+
+    # Creating the client never awaits, so there is no point at which another
+    # coroutine could interleave and create a second client
+    if _client is None:
+        _client = create_postgrest_client(os.getenv("SUPABASE_ANON_KEY", ""))
+
+    return _client
+
+async def close_supabase() -> None:
+    """Close the shared client's connection pool"""
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,31 +1,82 @@
-from typing import Dict, List, Any, Optional
-from supabase import create_client, Client
-import os
+from typing import Dict, List, Any, Optional, Tuple
+from postgrest import AsyncPostgrestClient
+from postgrest.types import ReturnMethod
 import re
-import json
 from datetime import datetime, timedelta
 import asyncio
+from types import MappingProxyType
+from .supabase_client import get_supabase
+
+# Patterns are compiled once at import rather than looked up on every call
+_PRICE_PATS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'\$(\d{1,3}(?:,\d{3})*(?:k|K)?)\s*(?:to|-)\s*\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)',
+    r'under\s*\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)',
+    r'up\s*to\s*\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)'
+))
+_BEDROOM_PAT = re.compile(r'\b(\d{1,2})\s*(?:bed|bedroom)', re.IGNORECASE)
+_LOCATION_PATS = tuple(re.compile(p, re.IGNORECASE) for p in (
+    r'in\s+([A-Za-z\s]+?)(?:\s|$|,)',
+    r'near\s+([A-Za-z\s]+?)(?:\s|$|,)'
+))
+_BUDGET_AMOUNT_PAT = re.compile(r'\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)')
+# Parsed prices are capped so absurd inputs can't overflow JSON encoding
+_MAX_PRICE = 10**12
+_EMAIL_PAT = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b')
+_PHONE_PAT = re.compile(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b')
+
+# Keyword sets are anchored at the start of a word only, so inflections
+# like "markets" or "affordable" still match as they did with substring checks
+_BUDGET_KEYWORD_PAT = re.compile(r'\b(?:budget|afford)', re.IGNORECASE)
+_DAY_PAT = re.compile(r'\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)', re.IGNORECASE)
+_MARKET_PAT = re.compile(r'\b(?:market|prices|trends)', re.IGNORECASE)
+_NEIGHBORHOOD_PAT = re.compile(r'\b(?:neighborhood|area|schools)', re.IGNORECASE)
+_COMPLAINT_PAT = re.compile(r'\b(?:complaint|problem|issue)', re.IGNORECASE)
+
+# Mock listings returned by search_properties until a real listings search exists
+_MOCK_PROPERTIES: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "prop_001",
+        "address": "123 Oak Street, Downtown",
+        "price": 450000,
+        "bedrooms": 3,
+        "bathrooms": 2.5,
+        "property_type": "house",
+        "description": "Beautiful single-family home"
+    },
+    {
+        "id": "prop_002", 
+        "address": "456 Pine Avenue, Midtown",
+        "price": 320000,
+        "bedrooms": 2,
+        "bathrooms": 2,
+        "property_type": "condo",
+        "description": "Modern condo with city views"
+    }
+)
+
+# Lookup tables for get_market_info and determine_priority. The inner dicts
+# stay plain dicts since they are JSON-encoded into the response prompt.
+_MARKET_INFO = MappingProxyType({
+    'market': {'average_price': '$425,000', 'trend': '+5.2% YoY'},
+    'neighborhood': {'school_rating': '8/10', 'safety': 'Above average'},
+    'general': {'info': 'General real estate information'}
+})
+_DEFAULT_MARKET_INFO = {'info': 'Information available'}
+_PRIORITY = MappingProxyType({'complaint': 'high', 'legal': 'urgent'})
 
 class RealEstateTools:
     def __init__(self):
-        self.supabase: Client = create_client(
-            os.getenv("SUPABASE_URL"),
-            os.getenv("SUPABASE_ANON_KEY")
-        )
+        self.supabase: AsyncPostgrestClient = get_supabase()
+        # Leads waiting for the background writer (see run_lead_writer)
+        self._lead_queue: asyncio.Queue = asyncio.Queue()
     
-    async def extract_search_criteria(self, user_input: str) -> Dict[str, Any]:
+    def extract_search_criteria(self, user_input: str) -> Dict[str, Any]:
         """Extract property search criteria from user input"""
         criteria = {}
         
         # Extract price range
-        price_patterns = [
-            r'\$(\d{1,3}(?:,\d{3})*(?:k|K)?)\s*(?:to|-)\s*\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)',
-            r'under\s*\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)',
-            r'up\s*to\s*\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)'
-        ]
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, user_input, re.IGNORECASE)
+        for pattern in _PRICE_PATS:
+            match = pattern.search(user_input)
             if match:
                 if len(match.groups()) == 2:  # Range
                     criteria['price_min'] = self._parse_price(match.group(1))
@@ -35,18 +86,13 @@ class RealEstateTools:
                 break
         
         # Extract bedrooms
-        bedroom_match = re.search(r'(\d+)\s*(?:bed|bedroom)', user_input, re.IGNORECASE)
+        bedroom_match = _BEDROOM_PAT.search(user_input)
         if bedroom_match:
             criteria['bedrooms'] = int(bedroom_match.group(1))
         
         # Extract location
-        location_patterns = [
-            r'in\s+([A-Za-z\s]+?)(?:\s|$|,)',
-            r'near\s+([A-Za-z\s]+?)(?:\s|$|,)'
-        ]
-        
-        for pattern in location_patterns:
-            match = re.search(pattern, user_input, re.IGNORECASE)
+        for pattern in _LOCATION_PATS:
+            match = pattern.search(user_input)
             if match:
                 location = match.group(1).strip()
                 if len(location) > 2:
@@ -59,73 +105,50 @@ class RealEstateTools:
         """Parse price string to integer"""
         price_str = price_str.replace(',', '').replace('$', '')
         if price_str.lower().endswith('k'):
-            return int(float(price_str[:-1]) * 1000)
-        return int(price_str)
+            return min(int(price_str[:-1]) * 1000, _MAX_PRICE)
+        return min(int(price_str), _MAX_PRICE)
     
-    async def search_properties(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def search_properties(self, criteria: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Search for properties (mock implementation)"""
-        mock_properties = [
-            {
-                "id": "prop_001",
-                "address": "123 Oak Street, Downtown",
-                "price": 450000,
-                "bedrooms": 3,
-                "bathrooms": 2.5,
-                "property_type": "house",
-                "description": "Beautiful single-family home"
-            },
-            {
-                "id": "prop_002", 
-                "address": "456 Pine Avenue, Midtown",
-                "price": 320000,
-                "bedrooms": 2,
-                "bathrooms": 2,
-                "property_type": "condo",
-                "description": "Modern condo with city views"
-            }
-        ]
-        
-        return mock_properties[:3]
+        return list(_MOCK_PROPERTIES[:3])
     
-    async def extract_qualification_info(self, user_input: str) -> Dict[str, Any]:
+    def extract_qualification_info(self, user_input: str) -> Dict[str, Any]:
         """Extract lead qualification information"""
         qualification_data = {}
         
         # Extract budget
-        price_match = re.search(r'\$?(\d{1,3}(?:,\d{3})*(?:k|K)?)', user_input)
-        if price_match and any(word in user_input.lower() for word in ['budget', 'afford']):
+        price_match = _BUDGET_AMOUNT_PAT.search(user_input)
+        if price_match and _BUDGET_KEYWORD_PAT.search(user_input):
             qualification_data['budget'] = self._parse_price(price_match.group(1))
         
         # Extract email
-        email_match = re.search(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b', user_input)
+        email_match = _EMAIL_PAT.search(user_input)
         if email_match:
             qualification_data['email'] = email_match.group()
         
         # Extract phone
-        phone_match = re.search(r'\b\d{3}[-.]?\d{3}[-.]?\d{4}\b', user_input)
+        phone_match = _PHONE_PAT.search(user_input)
         if phone_match:
             qualification_data['phone'] = phone_match.group()
         
         return qualification_data
     
-    async def get_missing_qualification_fields(self, lead_info: Dict[str, Any]) -> List[str]:
+    def get_missing_qualification_fields(self, lead_info: Dict[str, Any]) -> List[str]:
         """Get missing qualification fields"""
         required_fields = ['budget', 'timeline', 'name', 'email']
         return [field for field in required_fields if field not in lead_info]
     
-    async def extract_scheduling_info(self, user_input: str) -> Dict[str, Any]:
+    def extract_scheduling_info(self, user_input: str) -> Dict[str, Any]:
         """Extract scheduling information"""
         scheduling_info = {}
         
-        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
-        for day in days:
-            if day in user_input.lower():
-                scheduling_info['preferred_day'] = day
-                break
+        day_match = _DAY_PAT.search(user_input)
+        if day_match:
+            scheduling_info['preferred_day'] = day_match.group(1).lower()
         
         return scheduling_info
     
-    async def get_available_slots(self) -> List[Dict[str, Any]]:
+    def get_available_slots(self) -> List[Dict[str, Any]]:
         """Get available appointment slots"""
         base_date = datetime.now() + timedelta(days=1)
         slots = []
@@ -140,38 +163,85 @@ class RealEstateTools:
         
         return slots
     
-    async def classify_info_request(self, user_input: str) -> str:
+    def classify_info_request(self, user_input: str) -> str:
         """Classify information request type"""
-        if any(word in user_input.lower() for word in ['market', 'prices', 'trends']):
+        if _MARKET_PAT.search(user_input):
             return 'market'
-        elif any(word in user_input.lower() for word in ['neighborhood', 'area', 'schools']):
+        elif _NEIGHBORHOOD_PAT.search(user_input):
             return 'neighborhood'
         else:
             return 'general'
     
-    async def get_market_info(self, info_type: str) -> Dict[str, Any]:
+    def get_market_info(self, info_type: str) -> Dict[str, Any]:
         """Get market information"""
-        return {
-            'market': {'average_price': '$425,000', 'trend': '+5.2% YoY'},
-            'neighborhood': {'school_rating': '8/10', 'safety': 'Above average'},
-            'general': {'info': 'General real estate information'}
-        }.get(info_type, {'info': 'Information available'})
+        return _MARKET_INFO.get(info_type, _DEFAULT_MARKET_INFO)
     
-    async def analyze_escalation_need(self, user_input: str) -> str:
+    def analyze_escalation_need(self, user_input: str) -> str:
         """Analyze escalation need"""
-        if any(word in user_input.lower() for word in ['complaint', 'problem', 'issue']):
+        if _COMPLAINT_PAT.search(user_input):
             return 'complaint'
         return 'general_inquiry'
     
-    async def determine_priority(self, escalation_reason: str) -> str:
+    def determine_priority(self, escalation_reason: str) -> str:
         """Determine escalation priority"""
-        return {'complaint': 'high', 'legal': 'urgent'}.get(escalation_reason, 'low')
+        return _PRIORITY.get(escalation_reason, 'low')
+    
+    def queue_lead_data(self, lead_info: Dict[str, Any]) -> None:
+        """Queue lead data to be saved by the background lead writer"""
+        lead_data = {k: v for k, v in lead_info.items() if v is not None}
+        if lead_data:
+            self._lead_queue.put_nowait(lead_data)
     
-    async def save_lead_data(self, lead_info: Dict[str, Any]) -> None:
-        """Save lead data to Supabase"""
-        try:
-            lead_data = {k: v for k, v in lead_info.items() if v is not None}
-            if lead_data:
-                self.supabase.table('leads').insert(lead_data).execute()
-        except Exception as e:
-            print(f"Error saving lead: {e}") 
\ No newline at end of file
+    async def run_lead_writer(self, batch_size: int = 50, flush_interval: float = 0.5) -> None:
+        """Drain queued leads into Supabase in batches (run as a background task)"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._lead_queue.get()]
+            
+            # Collect whatever else arrives within the flush interval
+            deadline = loop.time() + flush_interval
+            try:
+                while len(batch) < batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._lead_queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                # Don't drop the partial batch when the writer is stopped
+                await self.save_leads(batch)
+                raise
+            
+            save = asyncio.ensure_future(self.save_leads(batch))
+            try:
+                await asyncio.shield(save)
+            except asyncio.CancelledError:
+                # Let an insert already in flight finish before stopping
+                await save
+                raise
+    
+    async def flush_leads(self) -> None:
+        """Save any leads still queued (called on shutdown)"""
+        batch = []
+        while not self._lead_queue.empty():
+            batch.append(self._lead_queue.get_nowait())
+        if batch:
+            await self.save_leads(batch)
+    
+    async def save_leads(self, leads: List[Dict[str, Any]]) -> None:
+        """Save lead data to Supabase, one insert per distinct set of columns"""
+        # A bulk insert takes its columns from the rows, so rows with
+        # different fields go in separate inserts
+        by_columns: Dict[frozenset, List[Dict[str, Any]]] = {}
+        for lead in leads:
+            by_columns.setdefault(frozenset(lead), []).append(lead)
+        
+        for rows in by_columns.values():
+            try:
+                # Nothing reads the created rows back, so don't have
+                # PostgREST send them
+                await self.supabase.table('leads').insert(rows, returning=ReturnMethod.minimal).execute()
+            except Exception as e:
+                print(f"Error saving leads: {e}")
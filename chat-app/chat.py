@@ -1,16 +1,36 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, BeforeValidator
+from typing import Annotated, List, Dict, Any, Optional, Tuple
+import asyncio
+import contextlib
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
 import os
+import re
+import time
+import httpx
 from dotenv import load_dotenv
-from agents.real_estate_agent import RealEstateAgent
 from agents.config_manager import AgentConfigManager
-from supabase import create_client, Client
+from agents import json_utils
+from agents.tools import RealEstateTools
+from agents.supabase_client import close_supabase, create_postgrest_client
+from postgrest import AsyncPostgrestClient
 
 load_dotenv()
 
-app = FastAPI(title="Real Estate Chat API")
+# Only this module's logger is configured; setting up the root logger would
+# also turn on httpx's per-request INFO lines
+logger = logging.getLogger(__name__)
+logger.setLevel(os.getenv("LOG_LEVEL", "info").upper())
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+logger.addHandler(_log_handler)
+logger.propagate = False
+
+app = FastAPI(title="Real Estate Chat API", default_response_class=ORJSONResponse)
 
 # CORS configuration
 cors_origin = os.getenv("CORS_ORIGIN", "http://localhost:3000")
@@ -22,23 +42,170 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Supabase client
+# Supabase client, created on startup (see init_supabase)
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-supabase: Client = None
+supabase: AsyncPostgrestClient = None
+
+@app.on_event("startup")
+async def init_supabase():
+    """Create the async Supabase client for the leads and stats endpoints"""
+    global supabase
+    
+    if supabase_url and supabase_key and supabase_url != "https://placeholder.supabase.co":
+        supabase = create_postgrest_client(
+            supabase_key,
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("SUPABASE_MAX_CONNECTIONS", "120")),
+                max_keepalive_connections=int(os.getenv("SUPABASE_MAX_KEEPALIVE", "80"))
+            )
+        )
+    else:
+        print("Warning: Supabase credentials not configured. Using mock data for leads.")
 
-if supabase_url and supabase_key and supabase_url != "https://placeholder.supabase.co":
-    supabase = create_client(supabase_url, supabase_key)
-else:
-    print("Warning: Supabase credentials not configured. Using mock data for leads.")
+@app.on_event("shutdown")
+async def close_supabase_pool():
+    """Close the Supabase client's connection pool"""
+    if supabase:
+        await supabase.aclose()
 
-# Initialize the LangGraph agent
-agent = RealEstateAgent()
+# Share the agent's dependencies across requests, so the admin endpoints
+# and the agent see the same config cache
 config_manager = AgentConfigManager()
+tools = RealEstateTools()
+agent = None
+
+def get_agent():
+    """Get the LangGraph agent, importing and building it on first use so
+    that langgraph isn't loaded until the first chat request"""
+    global agent
+    
+    if agent is None:
+        from agents.real_estate_agent import RealEstateAgent
+        agent = RealEstateAgent(config_manager=config_manager, tools=tools)
+    
+    return agent
+
+@app.on_event("startup")
+async def start_lead_writer():
+    """Start the background task that batches lead inserts"""
+    app.state.lead_writer = asyncio.create_task(tools.run_lead_writer())
+
+@app.on_event("shutdown")
+async def stop_lead_writer():
+    """Stop the lead writer, save anything still queued and close the agent's DB client"""
+    # Wait for the writer to finish its current batch before the client closes
+    app.state.lead_writer.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await app.state.lead_writer
+    await tools.flush_leads()
+    await close_supabase()
+
+# Sample leads served when Supabase isn't configured or a query fails
+MOCK_LEADS: Tuple[Dict[str, Any], ...] = (
+    {
+        "id": "1",
+        "name": "John Doe",
+        "email": "john@example.com",
+        "phone": "+1-555-0123",
+        "source": "Website Chat",
+        "score": 85,
+        "status": "qualified",
+        "created_at": "2024-01-15T10:30:00Z",
+        "last_contact": "2024-01-16T14:20:00Z",
+        "notes": "Interested in 3BR properties downtown. Budget $500k-750k."
+    },
+    {
+        "id": "2",
+        "name": "Jane Smith",
+        "email": "jane.smith@gmail.com",
+        "phone": "+1-555-0456",
+        "source": "Phone Call",
+        "score": 92,
+        "status": "contacted",
+        "created_at": "2024-01-14T09:15:00Z",
+        "last_contact": "2024-01-15T16:45:00Z",
+        "notes": "Looking for investment properties. Has experience in real estate."
+    },
+    {
+        "id": "3",
+        "name": "Mike Johnson",
+        "email": "mike@temp-mail.org",
+        "phone": "+1-555-0789",
+        "source": "Website Chat",
+        "score": 45,
+        "status": "new",
+        "created_at": "2024-01-16T11:20:00Z",
+        "last_contact": "2024-01-16T11:20:00Z",
+        "notes": "General inquiry about market conditions."
+    },
+    {
+        "id": "4",
+        "name": "Sarah Wilson",
+        "email": "sarah.wilson@outlook.com",
+        "phone": "+1-555-0321",
+        "source": "Website Chat",
+        "score": 78,
+        "status": "contacted",
+        "created_at": "2024-01-13T15:45:00Z",
+        "last_contact": "2024-01-14T10:30:00Z",
+        "notes": "First-time buyer. Looking for 2BR condo under $400k."
+    },
+    {
+        "id": "5",
+        "name": "David Brown",
+        "email": "david.brown@yahoo.com",
+        "phone": "+1-555-0654",
+        "source": "Phone Call",
+        "score": 95,
+        "status": "qualified",
+        "created_at": "2024-01-12T08:20:00Z",
+        "last_contact": "2024-01-13T14:15:00Z",
+        "notes": "Experienced investor. Looking for multi-family properties."
+    }
+)
+
+# Columns shown in the leads list; the detail view (get_lead) returns the full row
+LEAD_LIST_COLS = "id,name,email,phone,source,score,status,created_at,last_contact"
+
+# The conversation summary round-trips through the client and is pasted into
+# the system prompt, so only the fields the agent writes are kept (others are
+# dropped) and every value is bounded. Out-of-range values are dropped and
+# long strings truncated rather than rejected, so a summary the agent wrote
+# is always accepted back.
+def _bounded_int(low: int, high: int) -> BeforeValidator:
+    def check(value: Any) -> Optional[int]:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        return int(value) if low <= value <= high else None
+    return BeforeValidator(check)
+
+def _truncated_str(max_length: int) -> BeforeValidator:
+    def check(value: Any) -> Optional[str]:
+        return value[:max_length] if isinstance(value, str) else None
+    return BeforeValidator(check)
+
+SummaryPrice = Annotated[Optional[int], _bounded_int(0, 10**12)]
+
+class SearchCriteriaSummary(BaseModel):
+    price_min: SummaryPrice = None
+    price_max: SummaryPrice = None
+    bedrooms: Annotated[Optional[int], _bounded_int(0, 20)] = None
+    location: Annotated[Optional[str], _truncated_str(100)] = None
+
+class SchedulingSummary(BaseModel):
+    preferred_day: Annotated[Optional[str], _truncated_str(10)] = None
+
+class ConversationSummary(BaseModel):
+    search_criteria: Optional[SearchCriteriaSummary] = None
+    scheduling_request: Optional[SchedulingSummary] = None
+    last_info_topic: Annotated[Optional[str], _truncated_str(20)] = None
+    escalation_reason: Annotated[Optional[str], _truncated_str(20)] = None
 
 class ChatMessage(BaseModel):
     message: str
     conversation_history: List[Dict[str, Any]] = []
+    summary: ConversationSummary = ConversationSummary()
 
 class ChatResponse(BaseModel):
     response: str
@@ -46,6 +213,7 @@ class ChatResponse(BaseModel):
     lead_info: Dict[str, Any] = {}
     tools_used: List[str] = []
     current_step: str = ""
+    summary: ConversationSummary = ConversationSummary()
 
 class AgentConfig(BaseModel):
     personality: str
@@ -84,16 +252,17 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "chat-api", "agent": "langgraph"}
 
-@app.post("/api/chat", response_model=ChatResponse)
+@app.post("/api/chat", response_model=ChatResponse, response_model_exclude_none=True)
 async def chat(chat_message: ChatMessage):
     """
     Handle chat messages using LangGraph real estate agent
     """
     try:
         # Use the LangGraph agent to process the message
-        result = await agent.chat(
+        result = await get_agent().chat(
             message=chat_message.message,
-            conversation_history=chat_message.conversation_history
+            conversation_history=chat_message.conversation_history,
+            summary=chat_message.summary.model_dump(exclude_none=True)
         )
         
         return ChatResponse(
@@ -101,7 +270,8 @@ async def chat(chat_message: ChatMessage):
             conversation_history=result["conversation_history"],
             lead_info=result.get("lead_info", {}),
             tools_used=result.get("tools_used", []),
-            current_step=result.get("current_step", "")
+            current_step=result.get("current_step", ""),
+            summary=ConversationSummary.model_validate(result.get("summary", {}))
         )
         
     except Exception as e:
@@ -112,9 +282,47 @@ async def chat(chat_message: ChatMessage):
             conversation_history=chat_message.conversation_history + [
                 {"role": "user", "content": chat_message.message},
                 {"role": "assistant", "content": "I'm sorry, I'm having trouble processing your request right now. Please try again."}
-            ]
+            ],
+            summary=chat_message.summary
         )
 
+@app.post("/api/chat/stream")
+async def chat_stream(chat_message: ChatMessage):
+    """
+    Stream the agent's reply as server-sent events: "delta" events as tokens
+    arrive, then a "done" event with the same fields as /api/chat
+    """
+    async def events():
+        try:
+            async for event in get_agent().achat_stream(
+                message=chat_message.message,
+                conversation_history=chat_message.conversation_history,
+                summary=chat_message.summary.model_dump(exclude_none=True)
+            ):
+                if event["type"] == "done":
+                    # Send back only a summary the next request will accept
+                    event["summary"] = ConversationSummary.model_validate(
+                        event.get("summary", {})
+                    ).model_dump(exclude_none=True)
+                yield f"data: {json_utils.dumps(event)}\n\n"
+        
+        except Exception as e:
+            print(f"Chat stream error: {e}")
+            # Fallback response
+            fallback = "I'm sorry, I'm having trouble processing your request right now. Please try again."
+            event = {
+                "type": "done",
+                "response": fallback,
+                "conversation_history": chat_message.conversation_history + [
+                    {"role": "user", "content": chat_message.message},
+                    {"role": "assistant", "content": fallback}
+                ],
+                "summary": chat_message.summary.model_dump(exclude_none=True)
+            }
+            yield f"data: {json_utils.dumps(event)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # Agent Configuration Endpoints
 @app.get("/api/config")
 async def get_agent_config():
@@ -129,7 +337,7 @@ async def get_agent_config():
 async def update_agent_config(config_update: AgentConfig):
     """Update agent configuration from admin panel"""
     try:
-        updates = config_update.dict()
+        updates = config_update.model_dump()
         updated_config = await config_manager.update_agent_config(updates)
         return {"message": "Configuration updated successfully", "config": updated_config}
     except Exception as e:
@@ -153,8 +361,8 @@ async def update_agent_config_legacy(config_update: Dict[str, Any]):
 async def get_personality_presets():
     """Get available personality presets"""
     try:
-        presets = await config_manager.get_personality_presets()
-        return {"presets": presets}
+        presets = config_manager.get_personality_presets()
+        return {"presets": {name: dict(preset) for name, preset in presets.items()}}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -168,13 +376,39 @@ async def apply_personality_preset(preset_name: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Leads Management Endpoints
+
+# The dashboard stats are the same for every caller, so they are kept in
+# memory for a short window instead of re-running the queries on every poll
+LEAD_STATS_TTL = 30  # seconds
+_lead_stats_cache: Dict[str, Any] = {}
+_lead_stats_expires_at = 0.0
+
+@lru_cache(maxsize=1)
+def _week_ago_bucket(minute: int) -> str:
+    """Start of the "this week" window, recomputed once per minute"""
+    return (datetime.utcnow() - timedelta(days=7)).isoformat()
+
+def invalidate_lead_stats():
+    """Drop the cached dashboard stats after leads change"""
+    global _lead_stats_cache, _lead_stats_expires_at
+    _lead_stats_cache = {}
+    _lead_stats_expires_at = 0.0
+
 @app.get("/api/leads/stats")
-async def get_lead_stats():
+async def get_lead_stats(response: Response):
     """Get lead statistics for dashboard"""
-    from datetime import datetime, timedelta
+    global _lead_stats_cache, _lead_stats_expires_at
+    # Only real stats are marked cacheable; the mock and error fallbacks
+    # must not be kept by browsers or CDNs
+    cache_control = f"max-age={LEAD_STATS_TTL}, public"
+    
+    if _lead_stats_cache and time.monotonic() < _lead_stats_expires_at:
+        response.headers["Cache-Control"] = cache_control
+        return _lead_stats_cache
+    
     try:
         if not supabase:
-            print("Supabase not configured, returning mock data")
+            logger.debug("Supabase not configured, returning mock data")
             return {
                 "total_leads": 156,
                 "high_score_leads": 23,
@@ -182,40 +416,31 @@ async def get_lead_stats():
                 "qualified_leads": 8
             }
         
-        print("Fetching total leads...")
-        # Get total leads
-        total_response = supabase.table('leads').select('id').execute()
-        print(f"Total leads response: {total_response}")
-        total_leads = len(total_response.data) if total_response.data else 0
-        print(f"Total leads count: {total_leads}")
-
-        print("Fetching this week leads...")
-        # Get leads created this week
-        week_ago = (datetime.now() - timedelta(days=7)).isoformat()
-        this_week_response = supabase.table('leads').select('id').gte('created_at', week_ago).execute()
-        print(f"This week response: {this_week_response}")
-        this_week_leads = len(this_week_response.data) if this_week_response.data else 0
-        print(f"This week count: {this_week_leads}")
-
-        print("Fetching lead scores...")
-        # Get latest score per lead
-        scores_response = supabase.table('lead_scores').select('lead_id,score,created_at').order('created_at', desc=True).execute()
-        print(f"Scores response: {scores_response}")
-        
-        latest_scores = {}
-        if scores_response.data:
-            for row in scores_response.data:
-                lead_id = row['lead_id']
-                if lead_id not in latest_scores:
-                    latest_scores[lead_id] = row['score']
+        logger.debug("Fetching lead stats...")
+        # The three queries are independent, so run them concurrently
+        week_ago = _week_ago_bucket(int(time.time()) // 60)
+        total_response, this_week_response, stats_response = await asyncio.gather(
+            # Get total leads (counted server-side; at most one row comes back)
+            supabase.table('leads').select('id', count='exact').limit(1).execute(),
+            # Get leads created this week
+            supabase.table('leads').select('id', count='exact').gte('created_at', week_ago).limit(1).execute(),
+            # Latest score per lead, bucketed server-side
+            # (see supabase/migrations/003_lead_score_stats.sql)
+            supabase.rpc('get_lead_score_stats', {}).execute()
+        )
+        logger.debug("Total leads response: %s", total_response)
+        logger.debug("This week response: %s", this_week_response)
+        logger.debug("Score stats response: %s", stats_response)
         
-        print(f"Latest scores: {latest_scores}")
+        total_leads = total_response.count or 0
+        this_week_leads = this_week_response.count or 0
+        logger.debug("Total leads count: %s, This week count: %s", total_leads, this_week_leads)
         
-        # Compute high score and qualified counts
-        high_score_leads = sum(1 for score in latest_scores.values() if score >= 80)
-        qualified_leads = sum(1 for score in latest_scores.values() if score >= 70)
+        score_stats = stats_response.data[0] if stats_response.data else {}
+        high_score_leads = score_stats.get('high_score_leads') or 0
+        qualified_leads = score_stats.get('qualified_leads') or 0
         
-        print(f"High score leads: {high_score_leads}, Qualified leads: {qualified_leads}")
+        logger.debug("High score leads: %s, Qualified leads: %s", high_score_leads, qualified_leads)
 
         result = {
             "total_leads": total_leads,
@@ -223,13 +448,15 @@ async def get_lead_stats():
             "this_week_leads": this_week_leads,
             "qualified_leads": qualified_leads
         }
-        print(f"Final result: {result}")
+        logger.debug("Final result: %s", result)
+        
+        _lead_stats_cache = result
+        _lead_stats_expires_at = time.monotonic() + LEAD_STATS_TTL
+        response.headers["Cache-Control"] = cache_control
         return result
         
     except Exception as e:
-        print(f"Error fetching lead stats: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error fetching lead stats: %s", e)
         # Return mock data on error
         return {
             "total_leads": 156,
@@ -238,6 +465,43 @@ async def get_lead_stats():
             "qualified_leads": 8
         }
 
+_SEARCH_TERM_PAT = re.compile(r'\w+')
+_DIGITS_PAT = re.compile(r'\d+')
+
+def apply_lead_filters(query, search: Optional[str], status: Optional[str],
+                       score_min: Optional[int], score_max: Optional[int]):
+    """Apply the leads list filters to a PostgREST query"""
+    if search:
+        # Names and emails go through the indexed search_vec column as word
+        # prefixes (see supabase/migrations/005_leads_search_vector.sql);
+        # phone numbers are matched on the digits of the search, in order.
+        # Only word characters and digits reach the filter, so punctuation
+        # in the search can't break PostgREST's or=(...) syntax.
+        conditions = []
+        terms = _SEARCH_TERM_PAT.findall(search.lower())
+        if terms:
+            tsquery = " & ".join(f"{term}:*" for term in terms)
+            conditions.append(f'search_vec.fts(simple)."{tsquery}"')
+        digit_runs = _DIGITS_PAT.findall(search)
+        if digit_runs:
+            conditions.append(f"phone.ilike.%{'%'.join(digit_runs)}%")
+        
+        # A search with nothing searchable in it leaves the list unfiltered
+        if conditions:
+            # postgrest-py 0.13 has no or_(), so add the PostgREST "or" filter directly
+            query.params = query.params.add("or", f"({','.join(conditions)})")
+    
+    if status and status != 'all':
+        query = query.eq('status', status)
+    
+    if score_min is not None:
+        query = query.gte('score', score_min)
+    
+    if score_max is not None:
+        query = query.lte('score', score_max)
+    
+    return query
+
 @app.get("/api/leads")
 async def get_leads(
     search: Optional[str] = None,
@@ -251,87 +515,26 @@ async def get_leads(
     try:
         if not supabase:
             # Return mock data when Supabase is not configured
-            mock_leads = [
-                {
-                    "id": "1",
-                    "name": "John Doe",
-                    "email": "john@example.com",
-                    "phone": "+1-555-0123",
-                    "source": "Website Chat",
-                    "score": 85,
-                    "status": "qualified",
-                    "created_at": "2024-01-15T10:30:00Z",
-                    "last_contact": "2024-01-16T14:20:00Z",
-                    "notes": "Interested in 3BR properties downtown. Budget $500k-750k."
-                },
-                {
-                    "id": "2",
-                    "name": "Jane Smith",
-                    "email": "jane.smith@gmail.com",
-                    "phone": "+1-555-0456",
-                    "source": "Phone Call",
-                    "score": 92,
-                    "status": "contacted",
-                    "created_at": "2024-01-14T09:15:00Z",
-                    "last_contact": "2024-01-15T16:45:00Z",
-                    "notes": "Looking for investment properties. Has experience in real estate."
-                },
-                {
-                    "id": "3",
-                    "name": "Mike Johnson",
-                    "email": "mike@temp-mail.org",
-                    "phone": "+1-555-0789",
-                    "source": "Website Chat",
-                    "score": 45,
-                    "status": "new",
-                    "created_at": "2024-01-16T11:20:00Z",
-                    "last_contact": "2024-01-16T11:20:00Z",
-                    "notes": "General inquiry about market conditions."
-                },
-                {
-                    "id": "4",
-                    "name": "Sarah Wilson",
-                    "email": "sarah.wilson@outlook.com",
-                    "phone": "+1-555-0321",
-                    "source": "Website Chat",
-                    "score": 78,
-                    "status": "contacted",
-                    "created_at": "2024-01-13T15:45:00Z",
-                    "last_contact": "2024-01-14T10:30:00Z",
-                    "notes": "First-time buyer. Looking for 2BR condo under $400k."
-                },
-                {
-                    "id": "5",
-                    "name": "David Brown",
-                    "email": "david.brown@yahoo.com",
-                    "phone": "+1-555-0654",
-                    "source": "Phone Call",
-                    "score": 95,
-                    "status": "qualified",
-                    "created_at": "2024-01-12T08:20:00Z",
-                    "last_contact": "2024-01-13T14:15:00Z",
-                    "notes": "Experienced investor. Looking for multi-family properties."
-                }
-            ]
-            
-            # Apply filters to mock data
-            filtered_leads = mock_leads
+            # Apply filters to mock data in a single pass
+            search_lower = search.lower() if search else None
+            status_filter = status if status and status != 'all' else None
             
-            if search:
-                filtered_leads = [lead for lead in filtered_leads if 
-                    search.lower() in lead["name"].lower() or 
-                    search.lower() in lead["email"].lower() or 
+            def matches(lead: Dict[str, Any]) -> bool:
+                if search_lower and not (
+                    search_lower in lead["name"].lower() or
+                    search_lower in lead["email"].lower() or
                     search in lead["phone"]
-                ]
+                ):
+                    return False
+                if status_filter and lead["status"] != status_filter:
+                    return False
+                if score_min is not None and lead["score"] < score_min:
+                    return False
+                if score_max is not None and lead["score"] > score_max:
+                    return False
+                return True
             
-            if status and status != 'all':
-                filtered_leads = [lead for lead in filtered_leads if lead["status"] == status]
-            
-            if score_min is not None:
-                filtered_leads = [lead for lead in filtered_leads if lead["score"] >= score_min]
-            
-            if score_max is not None:
-                filtered_leads = [lead for lead in filtered_leads if lead["score"] <= score_max]
+            filtered_leads = [lead for lead in MOCK_LEADS if matches(lead)]
             
             # Apply pagination
             total_count = len(filtered_leads)
@@ -344,42 +547,27 @@ async def get_leads(
                 "offset": offset
             }
         
-        # Build query
-        query = supabase.table('leads').select('*')
-        
-        # Apply filters
-        if search:
-            query = query.or_(f"name.ilike.%{search}%,email.ilike.%{search}%,phone.ilike.%{search}%")
-        
-        if status and status != 'all':
-            query = query.eq('status', status)
-        
-        if score_min is not None:
-            query = query.gte('score', score_min)
-        
-        if score_max is not None:
-            query = query.lte('score', score_max)
-        
-        # Apply pagination
-        query = query.range(offset, offset + limit - 1)
+        # Fetch the page and the exact total in one request, with each lead's
+        # latest score embedded
+        query = apply_lead_filters(
+            supabase.table('leads').select(f"{LEAD_LIST_COLS},lead_scores(score,created_at)", count='exact'),
+            search, status, score_min, score_max
+        )
+        query = query.order('created_at', desc=True, foreign_table='lead_scores')
+        query = query.limit(1, foreign_table='lead_scores')
+        # postgrest-py treats the end of range() as exclusive
+        query = query.range(offset, offset + limit)
         
         # Execute query
-        response = query.execute()
+        response = await query.execute()
         leads = response.data
         
-        # Get total count for pagination
-        count_query = supabase.table('leads').select('id', count='exact')
-        if search:
-            count_query = count_query.or_(f"name.ilike.%{search}%,email.ilike.%{search}%,phone.ilike.%{search}%")
-        if status and status != 'all':
-            count_query = count_query.eq('status', status)
-        if score_min is not None:
-            count_query = count_query.gte('score', score_min)
-        if score_max is not None:
-            count_query = count_query.lte('score', score_max)
-        
-        count_response = count_query.execute()
-        total_count = count_response.count or 0
+        if response.count is not None:
+            total_count = response.count
+        else:
+            # No count came back; a partial page is the last page, so the
+            # rows seen so far are the total
+            total_count = offset + len(leads)
         
         return {
             "leads": leads,
@@ -391,22 +579,8 @@ async def get_leads(
     except Exception as e:
         print(f"Error fetching leads: {e}")
         # Return mock data on error
-        mock_leads = [
-            {
-                "id": "1",
-                "name": "John Doe",
-                "email": "john@example.com",
-                "phone": "+1-555-0123",
-                "source": "Website Chat",
-                "score": 85,
-                "status": "qualified",
-                "created_at": "2024-01-15T10:30:00Z",
-                "last_contact": "2024-01-16T14:20:00Z",
-                "notes": "Interested in 3BR properties downtown. Budget $500k-750k."
-            }
-        ]
         return {
-            "leads": mock_leads,
+            "leads": list(MOCK_LEADS[:1]),
             "total": 1,
             "limit": limit,
             "offset": offset
@@ -416,7 +590,7 @@ async def get_leads(
 async def get_lead(lead_id: str):
     """Get a specific lead by ID"""
     try:
-        response = supabase.table('leads').select('*').eq('id', lead_id).execute()
+        response = await supabase.table('leads').select('*').eq('id', lead_id).execute()
         
         if not response.data:
             raise HTTPException(status_code=404, detail="Lead not found")
@@ -427,15 +601,42 @@ async def get_lead(lead_id: str):
         print(f"Error fetching lead: {e}")
         raise HTTPException(status_code=500, detail="Error fetching lead")
 
+# Large imports are split so no single request body grows without bound
+LEAD_INSERT_CHUNK_SIZE = 500
+
+class LeadInsertError(Exception):
+    """A chunked insert failed part-way; `created` holds the rows already committed"""
+    def __init__(self, created: List[Dict[str, Any]], error: Exception):
+        super().__init__(str(error))
+        self.created = created
+
+async def insert_leads(leads: List[Lead]) -> List[Dict[str, Any]]:
+    """Insert leads, in chunks of at most LEAD_INSERT_CHUNK_SIZE rows sent one
+    after another, and return the created rows.
+    
+    Each chunk is its own transaction. If one fails, the earlier chunks stay
+    committed and LeadInsertError is raised with their rows, which are the
+    first len(created) leads in input order.
+    """
+    lead_data = [lead.model_dump(exclude={'id', 'created_at'}, mode='json') for lead in leads]
+    created = []
+    for i in range(0, len(lead_data), LEAD_INSERT_CHUNK_SIZE):
+        try:
+            response = await supabase.table('leads').insert(lead_data[i:i + LEAD_INSERT_CHUNK_SIZE]).execute()
+        except Exception as e:
+            raise LeadInsertError(created, e) from e
+        created.extend(response.data)
+    return created
+
 @app.post("/api/leads")
 async def create_lead(lead: Lead):
     """Create a new lead"""
     try:
-        lead_data = lead.dict(exclude={'id', 'created_at'})
-        response = supabase.table('leads').insert(lead_data).execute()
+        created = await insert_leads([lead])
+        invalidate_lead_stats()
         
-        if response.data:
-            return {"message": "Lead created successfully", "lead": response.data[0]}
+        if created:
+            return {"message": "Lead created successfully", "lead": created[0]}
         else:
             raise HTTPException(status_code=400, detail="Failed to create lead")
             
@@ -443,11 +644,46 @@ async def create_lead(lead: Lead):
         print(f"Error creating lead: {e}")
         raise HTTPException(status_code=500, detail="Error creating lead")
 
+@app.post("/api/leads/batch")
+async def create_leads_batch(leads: List[Lead]):
+    """Create several leads (e.g. a CRM import) with bulk inserts.
+    
+    Not atomic: large batches are inserted in chunks, and on failure the
+    error reports how many leads were created so a retry can resend only
+    the rest.
+    """
+    if not leads:
+        return {"message": "No leads to create", "leads": []}
+    
+    try:
+        created = await insert_leads(leads)
+        invalidate_lead_stats()
+        
+        if created:
+            return {"message": f"Created {len(created)} leads successfully", "leads": created}
+        else:
+            raise HTTPException(status_code=400, detail="Failed to create leads")
+    
+    except LeadInsertError as e:
+        print(f"Error creating leads after {len(e.created)} were saved: {e}")
+        if e.created:
+            invalidate_lead_stats()
+        raise HTTPException(status_code=500, detail={
+            "message": "Error creating leads",
+            "created": len(e.created),
+            "leads": e.created
+        })
+            
+    except Exception as e:
+        print(f"Error creating leads: {e}")
+        raise HTTPException(status_code=500, detail="Error creating leads")
+
 @app.put("/api/leads/{lead_id}")
 async def update_lead(lead_id: str, lead_update: Dict[str, Any]):
     """Update a lead"""
     try:
-        response = supabase.table('leads').update(lead_update).eq('id', lead_id).execute()
+        response = await supabase.table('leads').update(lead_update).eq('id', lead_id).execute()
+        invalidate_lead_stats()
         
         if response.data:
             return {"message": "Lead updated successfully", "lead": response.data[0]}
@@ -462,7 +698,8 @@ async def update_lead(lead_id: str, lead_update: Dict[str, Any]):
 async def delete_lead(lead_id: str):
     """Delete a lead"""
     try:
-        response = supabase.table('leads').delete().eq('id', lead_id).execute()
+        response = await supabase.table('leads').delete().eq('id', lead_id).execute()
+        invalidate_lead_stats()
         
         if response.data:
             return {"message": "Lead deleted successfully"}
@@ -0,0 +1,25 @@
+-- The API stores settings as JSON text in `value`; 001 only created
+-- `value_json`, so add the column, backfill it, and let rows written by the
+-- API omit `value_json`
+ALTER TABLE settings ADD COLUMN IF NOT EXISTS value TEXT;
+UPDATE settings SET value = value_json::text WHERE value IS NULL;
+ALTER TABLE settings ALTER COLUMN value_json DROP NOT NULL;
+
+-- Merge a JSON patch into a setting in a single statement, so config updates
+-- don't need a read-then-upsert round trip from the API.
+-- The stored value is JSON text; when the setting doesn't exist yet it is
+-- created from `base` with the patch applied on top.
+CREATE OR REPLACE FUNCTION update_setting_merge(
+    setting_key TEXT,
+    patch JSONB,
+    base JSONB DEFAULT '{}'::jsonb
+)
+RETURNS JSONB AS $$
+    INSERT INTO settings (key, value, value_json, updated_at)
+    VALUES (setting_key, (base || patch)::text, base || patch, NOW())
+    ON CONFLICT (key) DO UPDATE
+        SET value = (COALESCE(settings.value::jsonb, settings.value_json, base) || patch)::text,
+            value_json = COALESCE(settings.value::jsonb, settings.value_json, base) || patch,
+            updated_at = NOW()
+    RETURNING value::jsonb;
+$$ LANGUAGE sql;
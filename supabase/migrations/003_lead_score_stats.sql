@@ -0,0 +1,17 @@
+-- Latest-score-per-lead lookups read lead_scores newest first within each lead
+CREATE INDEX IF NOT EXISTS idx_lead_scores_lead_id_created_at
+    ON lead_scores(lead_id, created_at DESC);
+
+-- Dashboard score counts, computed from each lead's most recent score
+CREATE OR REPLACE FUNCTION get_lead_score_stats()
+RETURNS TABLE (high_score_leads INTEGER, qualified_leads INTEGER) AS $$
+    WITH latest AS (
+        SELECT DISTINCT ON (lead_id) score
+        FROM lead_scores
+        ORDER BY lead_id, created_at DESC
+    )
+    SELECT
+        (COUNT(*) FILTER (WHERE score >= 80))::INTEGER,
+        (COUNT(*) FILTER (WHERE score >= 70))::INTEGER
+    FROM latest;
+$$ LANGUAGE sql STABLE;
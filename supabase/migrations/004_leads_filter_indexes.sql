@@ -0,0 +1,15 @@
+-- The leads API filters on status and score, lists last_contact and writes
+-- notes; make sure the columns exist
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'new';
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS score INTEGER;
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS last_contact TIMESTAMP WITH TIME ZONE;
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS notes TEXT;
+
+-- Status + score range filters in get_leads
+CREATE INDEX IF NOT EXISTS idx_leads_status_score ON leads(status, score DESC);
+
+-- Phone search (phone ILIKE '%digits%') can't use a btree index; a trigram
+-- GIN index makes it index-backed. Names and emails are searched through
+-- search_vec instead (see 005_leads_search_vector.sql).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_leads_phone_trgm ON leads USING gin (phone gin_trgm_ops);
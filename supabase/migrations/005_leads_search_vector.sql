@@ -0,0 +1,8 @@
+-- Word-prefix search over lead names and emails. Emails are split on '@' and
+-- '.' so that "smith" or "gmail" match like any other word.
+ALTER TABLE leads ADD COLUMN IF NOT EXISTS search_vec tsvector
+    GENERATED ALWAYS AS (
+        to_tsvector('simple', coalesce(name, '') || ' ' || translate(coalesce(email, ''), '@.', '  '))
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_leads_search_vec ON leads USING gin (search_vec);
@@ -6,6 +6,7 @@ export const API_CONFIG = {
   // API endpoints
   ENDPOINTS: {
     CHAT: '/api/chat',
+    CHAT_STREAM: '/api/chat/stream',
     HEALTH: '/health',
   },
   
@@ -1,4 +1,4 @@
-import React, { createContext, useContext, useState, useCallback } from 'react'
+import React, { createContext, useContext, useState, useCallback, useRef } from 'react'
 import { getApiUrl, API_CONFIG } from '../config/api'
 
 interface Message {
@@ -24,6 +24,8 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
   const [messages, setMessages] = useState<Message[]>([])
   const [isOpen, setIsOpen] = useState(false)
   const [isLoading, setIsLoading] = useState(false)
+  // Running conversation summary from the agent, sent back with each message
+  const summaryRef = useRef<Record<string, unknown>>({})
 
   const openChat = useCallback(() => {
     setIsOpen(true)
@@ -53,28 +55,66 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
     setMessages(prev => [...prev, userMessage])
     setIsLoading(true)
 
+    const assistantId = (Date.now() + 1).toString()
+    let started = false
+
+    // Show the reply as it streams in, adding the message on the first event
+    const showReply = (reply: string) => {
+      if (!started) {
+        started = true
+        setMessages(prev => [...prev, {
+          id: assistantId,
+          content: reply,
+          role: 'assistant',
+          timestamp: new Date()
+        }])
+      } else {
+        setMessages(prev => prev.map(m => m.id === assistantId ? { ...m, content: reply } : m))
+      }
+    }
+
     try {
       // Call the Fly.io backend using the API configuration
-      const response = await fetch(getApiUrl(API_CONFIG.ENDPOINTS.CHAT), {
+      const response = await fetch(getApiUrl(API_CONFIG.ENDPOINTS.CHAT_STREAM), {
         method: 'POST',
         headers: API_CONFIG.DEFAULT_HEADERS,
-        body: JSON.stringify({ message: content }),
+        body: JSON.stringify({ message: content, summary: summaryRef.current }),
       })
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
 
-      const data = await response.json()
-      
-      const assistantMessage: Message = {
-        id: (Date.now() + 1).toString(),
-        content: data.response || "I'm sorry, I couldn't process your request. Please try again.",
-        role: 'assistant',
-        timestamp: new Date()
+      // Server-sent events: "delta" events carry tokens, "done" the full reply
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+      let reply = ''
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+
+        buffer += decoder.decode(value, { stream: true })
+        const events = buffer.split('\n\n')
+        buffer = events.pop() ?? ''
+
+        for (const event of events) {
+          if (!event.startsWith('data: ')) continue
+          const data = JSON.parse(event.slice(6))
+          if (data.type === 'delta') {
+            reply += data.content
+          } else {
+            reply = data.response || "I'm sorry, I couldn't process your request. Please try again."
+            summaryRef.current = data.summary || {}
+          }
+          showReply(reply)
+        }
       }
 
-      setMessages(prev => [...prev, assistantMessage])
+      if (!started) {
+        throw new Error('Empty response stream')
+      }
     } catch (error) {
       console.error('Error sending message:', error)
       const errorMessage: Message = {
@@ -83,7 +123,8 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
         role: 'assistant',
         timestamp: new Date()
       }
-      setMessages(prev => [...prev, errorMessage])
+      // Drop a partially streamed reply in favor of the error message
+      setMessages(prev => [...prev.filter(m => m.id !== assistantId), errorMessage])
     } finally {
       setIsLoading(false)
     }
@@ -91,6 +132,7 @@ export function ChatProvider({ children }: { children: React.ReactNode }) {
 
   const clearMessages = useCallback(() => {
     setMessages([])
+    summaryRef.current = {}
   }, [])
 
   const value: ChatContextType = {